@@ -100,15 +100,22 @@ class Question:
         return ''.join(s)
 
     def uncover(self, alternative):
+        # returns the statistics counters that changed, see QuestionStats
+        changed = []
         answer_state = self.answers[alternative]
         answer_state.uncovered = True
         if not self.started:
             self.first_guess = alternative
+            changed.append('started')
+            changed.append('first_guesses.{}'.format(alternative))
             if answer_state.correct:
                 self.correct_on_first_attempt = True
-        if answer_state.correct:
+                changed.append('correct_on_first_attempt')
+        if answer_state.correct and not self.finished:
             self.finished = True
+            changed.append('finished')
         self.started = True
+        return changed
 
     def get_state(self):
         if self.correct_on_first_attempt:
@@ -125,7 +132,7 @@ class Question:
 
 class Card:
 
-    def __init__(self, id, label, team, questions, alternatives, solution, color):
+    def __init__(self, id, label, team, questions, alternatives, solution, color, rat_id=None):
         self.id = id
         self.label = 'Team Quiz' if label is None else label
         self.team = team
@@ -133,30 +140,32 @@ class Card:
         self.alternatives = alternatives
         self.solution = solution
         self.color = color
+        self.rat_id = rat_id
 
     def to_dict(self):
         d = {'id': self.id, 'label': self.label, 'team': self.team, 'alternatives': self.alternatives,
-             'solution': self.solution, 'color': self.color,
+             'solution': self.solution, 'color': self.color, 'rat_id': self.rat_id,
              'questions': {key: self.questions[key].to_dict() for key in self.questions.keys()}}
         return d
 
     @staticmethod
-    def new_card(label, team, questions, alternatives, solution, color):
+    def new_card(label, team, questions, alternatives, solution, color, rat_id=None):
         id = '{}'.format(uuid.uuid4())
         questions = {}
         for index, c in enumerate(solution):
             questions[str(index + 1)] = Question.new_question(index + 1, c, alternatives=alternatives)
-        return Card(id, label, team, questions, alternatives, solution, color)
+        return Card(id, label, team, questions, alternatives, solution, color, rat_id)
 
     @staticmethod
     def from_dict(d):
         questions = {key: Question.from_dict(d['questions'][key]) for key in d['questions'].keys()}
         return Card(d['id'], d['label'], d['team'],
-                    questions, d['alternatives'], d['solution'], d['color'])
+                    questions, d['alternatives'], d['solution'], d['color'], d.get('rat_id'))
 
     def uncover(self, question, alternative):
+        # returns the changed statistics counters as paths into RATStats, like 'questions.3.started'
         question = self.questions[str(question)]
-        question.uncover(alternative)
+        return ['questions.{}.{}'.format(question.number, key) for key in question.uncover(alternative)]
 
     def get_card_html(self, base_url):
         s = ['<table width="100%">', '<thead>', '<tr>', '<th></th>']
@@ -215,6 +224,131 @@ class Card:
         return ''.join(s)
 
 
+class QuestionStats:
+    # class-wide aggregate for one question, updated by counter increments instead of rescanning the cards
+
+    def __init__(self, number, first_guesses, started=0, finished=0, correct_on_first_attempt=0):
+        self.number = number
+        self.first_guesses = first_guesses
+        self.started = started
+        self.finished = finished
+        self.correct_on_first_attempt = correct_on_first_attempt
+
+    def to_dict(self):
+        d = {'number': self.number,
+             'first_guesses': self.first_guesses,
+             'started': self.started,
+             'finished': self.finished,
+             'correct_on_first_attempt': self.correct_on_first_attempt}
+        return d
+
+    @staticmethod
+    def from_dict(d):
+        return QuestionStats(d['number'], d['first_guesses'], d['started'], d['finished'],
+                             d['correct_on_first_attempt'])
+
+    @staticmethod
+    def new_question_stats(number, alternatives=4):
+        return QuestionStats(number, {symbol: 0 for symbol in 'ABCDEFGH'[:alternatives]})
+
+    def add_question(self, question):
+        if question.started:
+            self.started = self.started + 1
+            self.first_guesses[question.first_guess] = self.first_guesses[question.first_guess] + 1
+        if question.finished:
+            self.finished = self.finished + 1
+        if question.correct_on_first_attempt:
+            self.correct_on_first_attempt = self.correct_on_first_attempt + 1
+
+    def get_percent_correct(self):
+        if self.started == 0:
+            return None
+        return round(100 * self.correct_on_first_attempt / self.started)
+
+    def get_summary(self):
+        return {'number': self.number,
+                'first_guesses': self.first_guesses,
+                'started': self.started,
+                'working': self.started - self.finished,
+                'finished': self.finished,
+                'correct_on_first_attempt': self.correct_on_first_attempt,
+                'percent_correct': self.get_percent_correct()}
+
+    def get_table_row(self):
+        s = ['<tr>', '<th scope="row">{}</th>'.format(self.number)]
+        for count in self.first_guesses.values():
+            s.append('<td>{}</td>'.format(count))
+        percent = self.get_percent_correct()
+        s.append('<td>{}</td>'.format('' if percent is None else '{}%'.format(percent)))
+        s.append('<td>{}</td>'.format(self.started - self.finished))
+        s.append('</tr>')
+        return ''.join(s)
+
+
+class RATStats:
+    # per-question statistics of a RAT, stored separately so that a click only increments a few counters
+
+    def __init__(self, stats_id, alternatives, questions):
+        self.stats_id = stats_id
+        self.alternatives = alternatives
+        self.questions = questions
+
+    def to_dict(self):
+        d = {'stats_id': self.stats_id, 'alternatives': self.alternatives,
+             'questions': {key: self.questions[key].to_dict() for key in self.questions.keys()}}
+        return d
+
+    @staticmethod
+    def from_dict(d):
+        questions = {key: QuestionStats.from_dict(d['questions'][key]) for key in d['questions'].keys()}
+        return RATStats(d['stats_id'], d['alternatives'], questions)
+
+    @staticmethod
+    def new_stats(stats_id, questions, alternatives):
+        stats = {}
+        for number in range(1, int(questions) + 1, 1):
+            stats[str(number)] = QuestionStats.new_question_stats(number, alternatives=int(alternatives))
+        return RATStats(stats_id, int(alternatives), stats)
+
+    @staticmethod
+    def from_cards(stats_id, questions, alternatives, cards):
+        # full rebuild, only needed for RATs created before the statistics were kept
+        stats = RATStats.new_stats(stats_id, questions, alternatives)
+        for card in cards:
+            for q in card.questions.values():
+                stats.questions[str(q.number)].add_question(q)
+        return stats
+
+    @staticmethod
+    def increment(d, paths):
+        # applies the counter paths returned by Card.uncover to a dictionary created by to_dict
+        for path in paths:
+            keys = path.split('.')
+            target = d
+            for key in keys[:-1]:
+                target = target[key]
+            target[keys[-1]] = target[keys[-1]] + 1
+
+    def get_summary(self):
+        return {'alternatives': 'ABCDEFGH'[:self.alternatives],
+                'questions': [q.get_summary() for q in self.questions.values()]}
+
+    def get_table(self):
+        s = ['<table class="table table-sm">', '<thead>', '<tr>', '<th scope="col">Question</th>']
+        for symbol in 'ABCDEFGH'[:self.alternatives]:
+            s.append('<th scope="col">{}</th>'.format(symbol))
+        s.append('<th scope="col">Correct on first try</th>')
+        s.append('<th scope="col">Working</th>')
+        s.append('</tr>')
+        s.append('</thead>')
+        s.append('<tbody>')
+        for q in self.questions.values():
+            s.append(q.get_table_row())
+        s.append('</tbody>')
+        s.append('</table>')
+        return ''.join(s)
+
+
 class RAT:
 
     def __init__(self, private_id, public_id, label, teams, questions, alternatives, solution, team_colors, creator):
@@ -267,12 +401,14 @@ class RAT:
         s.append('</table>')
         return ''.join(s)
 
-    def html_teacher(self, base_url, cards):
+    def html_teacher(self, base_url, cards, stats):
         public_url = base_url + 'rat/{}'.format(self.public_id)
         private_url = base_url + 'teacher/{}'.format(self.private_id)
         download_url = base_url + 'download/{}'.format(self.private_id)
+        stats_url = base_url + 'stats/{}'.format(self.private_id)
         return render_template('rat_teacher.html', public_url=public_url, private_url=private_url,
-                               table=self.get_status_table(base_url, cards), download_url=download_url)
+                               table=self.get_status_table(base_url, cards), download_url=download_url,
+                               stats_table=stats.get_table(), stats_url=stats_url)
 
     def html_students(self, base_url):
         s = []
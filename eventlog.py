@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EventLog:
+    # append-only log of create/grab/uncover events for the in-memory mode,
+    # with periodic snapshots so that a restart only has to replay the events since the last snapshot.
+    # the events must be idempotent: after a crash during a snapshot, some of them are replayed on top of
+    # a snapshot that already contains them
+
+    def __init__(self, directory, sync_interval=1.0, snapshot_interval=60.0):
+        self.directory = directory
+        self.log_path = os.path.join(directory, 'events.jsonl')
+        # the log of the previous period, kept until the snapshot that contains its events is on disk
+        self.old_log_path = os.path.join(directory, 'events.old.jsonl')
+        self.snapshot_path = os.path.join(directory, 'snapshot.json')
+        self.sync_interval = sync_interval
+        self.snapshot_interval = snapshot_interval
+        # reentrant, so that a request can change the state and append its event in one critical section;
+        # a snapshot then never sees a state change without the rest of it.
+        # no disk I/O happens while holding it, so a request never waits for an fsync
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+        self.file = None
+        self.dirty = False
+        self.events_since_snapshot = 0
+        self.last_snapshot = time.monotonic()
+        self.get_state = None
+        self.thread = None
+
+    def restore(self, apply_snapshot, apply_event):
+        # load the last snapshot and replay the logs on top of it, call before start()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                apply_snapshot(json.load(f))
+        replayed = 0
+        for path in [self.old_log_path, self.log_path]:
+            if os.path.exists(path):
+                replayed = replayed + self.replay(path, apply_event)
+        self.events_since_snapshot = replayed
+        return replayed
+
+    def replay(self, path, apply_event):
+        replayed = 0
+        with open(path, 'rb+') as f:
+            lines = f.readlines()
+            end = 0
+            for index, line in enumerate(lines):
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    event = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    if index == len(lines) - 1:
+                        # torn write of the last line before a crash, cut off so new events start on a clean line
+                        f.truncate(end)
+                    else:
+                        logger.warning('Skipping corrupt line {} in {}'.format(index + 1, path))
+                    end = end + len(line)
+                    continue
+                end = end + len(line)
+                try:
+                    apply_event(event)
+                except Exception:
+                    logger.exception('Skipping event on line {} in {}'.format(index + 1, path))
+                    continue
+                replayed = replayed + 1
+        return replayed
+
+    def start(self, get_state):
+        # get_state returns the live state, it is serialized while holding the lock
+        os.makedirs(self.directory, exist_ok=True)
+        self.get_state = get_state
+        if self.events_since_snapshot > 0 or os.path.exists(self.old_log_path):
+            # compact what was restored, so that a later rotation never overwrites events that are in no snapshot
+            self.write_snapshot(json.dumps(get_state()))
+            if os.path.exists(self.old_log_path):
+                os.remove(self.old_log_path)
+            self.file = open(self.log_path, 'w', encoding='utf-8')
+            self.events_since_snapshot = 0
+        else:
+            self.file = open(self.log_path, 'a', encoding='utf-8')
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def append(self, event):
+        # only written to the OS here, fsync happens in batches on the timer thread
+        line = json.dumps(event) + '\n'
+        with self.lock:
+            if self.stopped.is_set():
+                logger.warning('Event log is closed, dropping event {}'.format(line.strip()))
+                return
+            self.file.write(line)
+            self.file.flush()
+            self.dirty = True
+            self.events_since_snapshot = self.events_since_snapshot + 1
+
+    def sync(self):
+        with self.lock:
+            if not self.dirty or self.file.closed:
+                return
+            fd = os.dup(self.file.fileno())
+            self.dirty = False
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def snapshot(self):
+        # callers change the state and append the event while holding the lock, so the state serialized here
+        # contains exactly the events in the rotated log; the new log starts with the next event
+        with self.lock:
+            if self.stopped.is_set():
+                return
+            data = json.dumps(self.get_state())
+            self.file.close()
+            os.replace(self.log_path, self.old_log_path)
+            self.file = open(self.log_path, 'w', encoding='utf-8')
+            self.dirty = False
+            self.events_since_snapshot = 0
+            self.last_snapshot = time.monotonic()
+        self.write_snapshot(data)
+        os.remove(self.old_log_path)
+
+    def write_snapshot(self, data):
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        self.sync_directory()
+
+    def sync_directory(self):
+        # makes the renames of the snapshot and the logs durable
+        if os.name != 'posix':
+            return
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        with self.lock:
+            if self.stopped.is_set():
+                return
+            self.stopped.set()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+    def run(self):
+        while not self.stopped.wait(self.sync_interval):
+            if self.events_since_snapshot > 0 and time.monotonic() - self.last_snapshot >= self.snapshot_interval:
+                self.snapshot()
+            else:
+                self.sync()
@@ -1,14 +1,18 @@
-from flask import Flask, request, redirect, render_template, url_for, session
+from flask import Flask, request, redirect, render_template, url_for, session, jsonify
 from flask_login import LoginManager, login_required, login_user, logout_user, current_user
 from flask_pymongo import PyMongo
-from classes import RAT, Card, User
+from classes import RAT, RATStats, Card, User
+from eventlog import EventLog
 from authlib.integrations.flask_client import OAuth
 from dotenv import load_dotenv
+import atexit
+import contextlib
 import datetime
 import uuid
 import random
 import string
 import os
+import threading
 
 app = Flask(__name__)
 
@@ -47,8 +51,15 @@ cards = {}
 rats_by_private_id = {}
 # student access to RAT
 rats_by_public_id = {}
+# teacher UUID to question statistics
+stats_by_private_id = {}
 
 use_variables = False
+# in-memory mode only: directory for the event log and snapshots, None disables persistence
+data_dir = os.getenv('TEAMPYS_DATA_DIR')
+event_log = None
+# in-memory mode without event log: serializes the read-modify-write of the stored dictionaries
+memory_lock = threading.RLock()
 
 
 @login_manager.user_loader
@@ -125,6 +136,180 @@ def store_card(card):
         ratdb.replace_one({'id': card.id}, data, upsert=True)
 
 
+def store_uncover(card, number, alternative, was_started, was_finished):
+    # returns False if another request changed the question since the card was read
+    if use_variables:
+        # the caller holds state_lock(), so nobody else can have changed it
+        store_card(card)
+        return True
+    question = card.questions[str(number)]
+    prefix = 'questions.{}.'.format(number)
+    result = ratdb.update_one({'id': card.id, prefix + 'started': was_started, prefix + 'finished': was_finished},
+                              {'$set': {prefix + 'answers.{}.uncovered'.format(alternative): True,
+                                        prefix + 'started': question.started,
+                                        prefix + 'first_guess': question.first_guess,
+                                        prefix + 'correct_on_first_attempt': question.correct_on_first_attempt,
+                                        prefix + 'finished': question.finished}})
+    return result.matched_count == 1
+
+
+def uncover_card(card, number, alternative):
+    # the statistics may only be incremented if this request really changed the card, so a double-click
+    # that read the same card twice only counts once: the loser of the race uncovers again on the new card
+    while True:
+        question = card.questions[str(number)]
+        was_started, was_finished = question.started, question.finished
+        changed = card.uncover(number, alternative)
+        if store_uncover(card, number, alternative, was_started, was_finished):
+            return card, changed
+        card = find_card_by_id(card.id)
+
+
+def find_stats_by_private_id(private_id):
+    if use_variables:
+        global stats_by_private_id
+        if private_id in stats_by_private_id:
+            return RATStats.from_dict(stats_by_private_id[private_id])
+    else:
+        data = ratdb.find_one({'stats_id': private_id})
+        if data:
+            return RATStats.from_dict(data)
+    return None
+
+
+def store_stats(stats):
+    data = stats.to_dict()
+    if use_variables:
+        global stats_by_private_id
+        stats_by_private_id[stats.stats_id] = data
+    else:
+        ratdb.replace_one({'stats_id': stats.stats_id}, data, upsert=True)
+
+
+def increment_stats(private_id, paths):
+    # only touches the changed counters, so a click never rescans the cards of the other teams
+    if len(paths) == 0:
+        return
+    if use_variables:
+        global stats_by_private_id
+        if private_id in stats_by_private_id:
+            RATStats.increment(stats_by_private_id[private_id], paths)
+    else:
+        ratdb.update_one({'stats_id': private_id}, {'$inc': {path: 1 for path in paths}})
+
+
+def find_cards_of_rat(rat):
+    rat_cards = []
+    for card_id in rat.card_ids_by_team.values():
+        card = find_card_by_id(card_id)
+        if card is not None:
+            rat_cards.append(card)
+    return rat_cards
+
+
+def link_card_to_rat(card_id, private_id):
+    # only sets the field, so that a concurrent uncover of the same card is not overwritten
+    if use_variables:
+        global cards
+        if card_id in cards:
+            cards[card_id]['rat_id'] = private_id
+    else:
+        ratdb.update_one({'id': card_id}, {'$set': {'rat_id': private_id}})
+
+
+def get_stats(rat):
+    stats = find_stats_by_private_id(rat.private_id)
+    if stats is None:
+        # RAT created before statistics were kept: link its cards first so that later uncovers
+        # increment the counters, then rebuild the counters once from the cards
+        with state_lock():
+            for card_id in rat.card_ids_by_team.values():
+                link_card_to_rat(card_id, rat.private_id)
+            stats = RATStats.from_cards(rat.private_id, rat.questions, rat.alternatives, find_cards_of_rat(rat))
+            store_stats(stats)
+    return stats
+
+
+def state_lock():
+    # with an event log, a change of the state and its event must not be separated by a snapshot;
+    # MongoDB needs no lock, the conditional updates in store_uncover take care of concurrent requests
+    if not use_variables:
+        return contextlib.nullcontext()
+    if event_log is not None:
+        return event_log.lock
+    return memory_lock
+
+
+def log_event(event):
+    if use_variables and event_log is not None:
+        event_log.append(event)
+
+
+def get_state():
+    # the live dictionaries, some of them are changed in place (statistics counters, rat_id of cards),
+    # so EventLog serializes them while holding the lock
+    return {'cards': cards, 'rats': rats_by_private_id, 'stats': stats_by_private_id}
+
+
+def apply_snapshot(state):
+    global cards
+    global rats_by_private_id
+    global rats_by_public_id
+    global stats_by_private_id
+    cards = state['cards']
+    rats_by_private_id = state['rats']
+    rats_by_public_id = {data['public_id']: data for data in rats_by_private_id.values()}
+    stats_by_private_id = state['stats']
+
+
+def apply_event(event):
+    if event['op'] == 'create':
+        if find_rat_by_private_id(event['rat']['private_id']) is not None:
+            # already in the snapshot, creating it again would reset the cards
+            return
+        for data in event['cards']:
+            store_card(Card.from_dict(data))
+        store_stats(RATStats.from_dict(event['stats']))
+        store_rat(RAT.from_dict(event['rat']))
+    elif event['op'] == 'grab':
+        rat = find_rat_by_public_id(event['public_id'])
+        if rat is not None:
+            rat.grab(event['team'])
+            store_rat(rat)
+    elif event['op'] == 'uncover':
+        card = find_card_by_id(event['card'])
+        if card is not None:
+            card, changed = uncover_card(card, event['question'], event['alternative'])
+            if card.rat_id is not None:
+                increment_stats(card.rat_id, changed)
+
+
+def create_indexes():
+    # cards, RATs and statistics share one collection, so every lookup needs an index to stay fast
+    for key in ['id', 'rat_id', 'private_id', 'public_id', 'stats_id']:
+        ratdb.create_index(key, sparse=True)
+
+
+def init_storage():
+    # call once, and only in the process that serves requests
+    if use_variables:
+        init_event_log()
+    else:
+        create_indexes()
+
+
+def init_event_log():
+    global event_log
+    if not use_variables or data_dir is None or event_log is not None:
+        return
+    event_log = EventLog(data_dir)
+    replayed = event_log.restore(apply_snapshot, apply_event)
+    app.logger.info('Restored {} RATs and replayed {} events from {}'.format(len(rats_by_private_id), replayed,
+                                                                          data_dir))
+    event_log.start(get_state)
+    atexit.register(event_log.close)
+
+
 @app.route('/')
 def index():
     action_url = request.host_url + 'join'
@@ -189,11 +374,18 @@ def create():
     creator = current_user.get_id()
     rat = RAT(private_id, public_id, label, teams, questions, alternatives, solution, team_colors, creator)
     # create a new card for each team
-    for team in range(1, int(teams) + 1, 1):
-        card = Card.new_card(label, str(team), int(questions), int(alternatives), solution, rat.team_colors[team - 1])
-        store_card(card)
-        rat.card_ids_by_team[str(team)] = card.id
-    store_rat(rat)
+    new_cards = []
+    with state_lock():
+        for team in range(1, int(teams) + 1, 1):
+            card = Card.new_card(label, str(team), int(questions), int(alternatives), solution,
+                                 rat.team_colors[team - 1], rat.private_id)
+            store_card(card)
+            new_cards.append(card.to_dict())
+            rat.card_ids_by_team[str(team)] = card.id
+        stats = RATStats.new_stats(rat.private_id, questions, alternatives)
+        store_stats(stats)
+        store_rat(rat)
+        log_event({'op': 'create', 'rat': rat.to_dict(), 'cards': new_cards, 'stats': stats.to_dict()})
     return redirect("../teacher/{}".format(rat.private_id), code=302)
 
 
@@ -202,44 +394,54 @@ def show_rat_teacher(private_id):
     rat = find_rat_by_private_id(private_id)
     if rat is None:
         return "Could not find rat."
-    rat_cards = []
-    for card_id in rat.card_ids_by_team.values():
-        card = find_card_by_id(card_id)
-        if card is not None:
-            rat_cards.append(card)
-    return rat.html_teacher(request.host_url, rat_cards)
+    return rat.html_teacher(request.host_url, find_cards_of_rat(rat), get_stats(rat))
+
+
+@app.route('/stats/<private_id>/')
+def show_rat_stats(private_id):
+    stats = find_stats_by_private_id(private_id)
+    if stats is None:
+        rat = find_rat_by_private_id(private_id)
+        if rat is None:
+            return "Could not find rat."
+        stats = get_stats(rat)
+    return jsonify(stats.get_summary())
 
 
 @app.route('/card/<id>/')
 def show_card(id):
-    card = find_card_by_id(id)
-    if card is None:
-        return "Could not find card."
-    # check if the page request also answers a question
-    if 'question' in request.form:  # and ('alternative' in request.form):
-        question = request.form['question']
-        alternative = request.form['alternative']
-        card.uncover(question, alternative)
-    if 'question' in request.args:  # and ('alternative' in request.form):
-        question = request.args['question']
-        alternative = request.args['alternative']
-        card.uncover(question, alternative)
-    store_card(card)
+    with state_lock():
+        card = find_card_by_id(id)
+        if card is None:
+            return "Could not find card."
+        # check if the page request also answers a question
+        answers = []
+        if 'question' in request.form:  # and ('alternative' in request.form):
+            answers.append((request.form['question'], request.form['alternative']))
+        if 'question' in request.args:  # and ('alternative' in request.form):
+            answers.append((request.args['question'], request.args['alternative']))
+        for question, alternative in answers:
+            card, changed = uncover_card(card, question, alternative)
+            if card.rat_id is not None:
+                increment_stats(card.rat_id, changed)
+            log_event({'op': 'uncover', 'card': card.id, 'question': question, 'alternative': alternative})
     return card.get_card_html(request.host_url)
 
 
 @app.route('/grab/<public_id>/<team>')
 def grab_rat_students(public_id, team):
-    rat = find_rat_by_public_id(public_id)
-    if rat is None:
-        return "Could not find RAT."
-    card_id = rat.grab(team)
-    if card_id is None:
-        return 'Somebody already grabbed that card.'
-    card = find_card_by_id(card_id)
-    if card is None:
-        return "Could not find card with ID {}".format(card_id)
-    store_rat(rat)
+    with state_lock():
+        rat = find_rat_by_public_id(public_id)
+        if rat is None:
+            return "Could not find RAT."
+        card_id = rat.grab(team)
+        if card_id is None:
+            return 'Somebody already grabbed that card.'
+        card = find_card_by_id(card_id)
+        if card is None:
+            return "Could not find card with ID {}".format(card_id)
+        store_rat(rat)
+        log_event({'op': 'grab', 'public_id': public_id, 'team': team})
     return redirect("../../card/{}".format(card_id), code=302)
 
 
@@ -248,12 +450,7 @@ def download(private_id, format):
     rat = find_rat_by_private_id(private_id)
     if rat is None:
         return "Could not find RAT."
-    rat_cards = []
-    for card_id in rat.card_ids_by_team.values():
-        card = find_card_by_id(card_id)
-        if card is not None:
-            rat_cards.append(card)
-    return rat.download(format, rat_cards)
+    return rat.download(format, find_cards_of_rat(rat))
 
 
 @app.route('/login')
@@ -278,4 +475,7 @@ def logout():
 
 
 if __name__ == "__main__":
+    # with debug=True, the reloader runs the app in a child process; the parent must not restore or write the log
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_storage()
     app.run(host='0.0.0.0', port=80, debug=True)
@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+
+from eventlog import EventLog
+
+
+class State:
+    # stands in for the cards and statistics of teampys: an uncover changes the card and, only the
+    # first time, increments a counter, so replaying an uncover twice does not change anything
+
+    def __init__(self):
+        self.uncovered = {}
+        self.counter = 0
+
+    def uncover_card(self, event):
+        if event['card'] in self.uncovered:
+            return False
+        self.uncovered[event['card']] = event['alternative']
+        return True
+
+    def apply_event(self, event):
+        if event['op'] != 'uncover':
+            raise KeyError(event['op'])
+        if self.uncover_card(event):
+            self.counter = self.counter + 1
+
+    def get_state(self):
+        return {'uncovered': dict(self.uncovered), 'counter': self.counter}
+
+    def apply_snapshot(self, state):
+        self.uncovered = state['uncovered']
+        self.counter = state['counter']
+
+
+def uncover(card, alternative='A'):
+    return {'op': 'uncover', 'card': card, 'alternative': alternative}
+
+
+def start_log(directory, state, **kwargs):
+    log = EventLog(str(directory), **kwargs)
+    log.restore(state.apply_snapshot, state.apply_event)
+    log.start(state.get_state)
+    return log
+
+
+def record(log, state, event):
+    with log.lock:
+        state.apply_event(event)
+        log.append(event)
+
+
+def restored(directory):
+    state = State()
+    replayed = EventLog(str(directory)).restore(state.apply_snapshot, state.apply_event)
+    return state, replayed
+
+
+def test_restore_replays_log(tmp_path):
+    state = State()
+    log = start_log(tmp_path, state)
+    for card in ['1', '2', '3']:
+        record(log, state, uncover(card))
+    log.close()
+    state, replayed = restored(tmp_path)
+    assert replayed == 3
+    assert state.counter == 3
+    assert state.uncovered == {'1': 'A', '2': 'A', '3': 'A'}
+
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    state = State()
+    log = start_log(tmp_path, state)
+    record(log, state, uncover('1'))
+    log.close()
+    path = os.path.join(str(tmp_path), 'events.jsonl')
+    with open(path, 'a') as f:
+        f.write('{"op": "uncover", "ca')
+    state, replayed = restored(tmp_path)
+    assert replayed == 1
+    with open(path) as f:
+        assert f.read() == json.dumps(uncover('1')) + '\n'
+
+
+def test_restart_compacts_and_continues(tmp_path):
+    state = State()
+    log = start_log(tmp_path, state)
+    record(log, state, uncover('1'))
+    log.close()
+    state = State()
+    log = start_log(tmp_path, state)
+    record(log, state, uncover('2'))
+    log.close()
+    with open(os.path.join(str(tmp_path), 'events.jsonl')) as f:
+        assert len(f.readlines()) == 1
+    state, replayed = restored(tmp_path)
+    assert replayed == 1
+    assert state.uncovered == {'1': 'A', '2': 'A'}
+
+
+def test_bad_lines_in_the_middle_are_skipped(tmp_path):
+    lines = [json.dumps(uncover('1')), 'not json', json.dumps({'op': 'unknown'}), json.dumps(uncover('2'))]
+    with open(os.path.join(str(tmp_path), 'events.jsonl'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    state, replayed = restored(tmp_path)
+    assert replayed == 2
+    assert state.uncovered == {'1': 'A', '2': 'A'}
+    with open(os.path.join(str(tmp_path), 'events.jsonl')) as f:
+        assert len(f.readlines()) == 4
+
+
+def test_restore_after_snapshot(tmp_path):
+    state = State()
+    log = start_log(tmp_path, state)
+    record(log, state, uncover('1'))
+    record(log, state, uncover('2'))
+    log.snapshot()
+    record(log, state, uncover('3'))
+    log.close()
+    with open(os.path.join(str(tmp_path), 'events.jsonl')) as f:
+        assert len(f.readlines()) == 1
+    state, replayed = restored(tmp_path)
+    assert replayed == 1
+    assert state.counter == 3
+    assert state.uncovered == {'1': 'A', '2': 'A', '3': 'A'}
+
+
+def test_snapshot_waits_for_state_change_and_event(tmp_path):
+    # a snapshot between the card change and the counter increment would lose the increment for good,
+    # since replaying the uncover finds the card already uncovered
+    state = State()
+    log = start_log(tmp_path, state)
+    event = uncover('1')
+    with log.lock:
+        state.uncover_card(event)
+        snapshot = threading.Thread(target=log.snapshot)
+        snapshot.start()
+        snapshot.join(0.2)
+        assert snapshot.is_alive()
+        state.counter = state.counter + 1
+        log.append(event)
+    snapshot.join()
+    log.close()
+    state, _ = restored(tmp_path)
+    assert state.counter == 1
+    assert state.uncovered == {'1': 'A'}
+
+
+def test_crash_during_snapshot(tmp_path):
+    # the old log is only removed once the snapshot is on disk; if that never happened, both logs are replayed
+    state = State()
+    log = start_log(tmp_path, state)
+    record(log, state, uncover('1'))
+    with log.lock:
+        log.file.close()
+        os.replace(log.log_path, log.old_log_path)
+        log.file = open(log.log_path, 'w')
+    record(log, state, uncover('2'))
+    log.close()
+    state, replayed = restored(tmp_path)
+    assert replayed == 2
+    assert state.uncovered == {'1': 'A', '2': 'A'}
+
+
+def test_append_after_close_is_dropped(tmp_path):
+    state = State()
+    log = start_log(tmp_path, state)
+    log.close()
+    log.append(uncover('1'))
+    log.close()
+    state, replayed = restored(tmp_path)
+    assert replayed == 0
+
+
+def test_close_stops_thread(tmp_path):
+    state = State()
+    log = start_log(tmp_path, state, sync_interval=0.01, snapshot_interval=0.0)
+    record(log, state, uncover('1'))
+    log.close()
+    log.thread.join(1.0)
+    assert not log.thread.is_alive()
@@ -0,0 +1,87 @@
+import json
+import os
+
+import teampys
+from classes import RATStats
+from eventlog import EventLog
+
+
+def use_memory(monkeypatch, tmp_path):
+    monkeypatch.setattr(teampys, 'use_variables', True)
+    monkeypatch.setattr(teampys, 'data_dir', str(tmp_path))
+    monkeypatch.setattr(teampys, 'event_log', None)
+    monkeypatch.setattr(teampys, 'cards', {})
+    monkeypatch.setattr(teampys, 'rats_by_private_id', {})
+    monkeypatch.setattr(teampys, 'rats_by_public_id', {})
+    monkeypatch.setattr(teampys, 'stats_by_private_id', {})
+    monkeypatch.setitem(teampys.app.config, 'LOGIN_DISABLED', True)
+
+
+def create(client):
+    response = client.get('/create?teams=3&questions=2&alternatives=4&solution=AB')
+    return teampys.find_rat_by_private_id(response.headers['Location'].split('/')[-1])
+
+
+def answer(client, rat, team, question, alternative):
+    card_id = rat.card_ids_by_team[str(team)]
+    client.get('/card/{}/?question={}&alternative={}'.format(card_id, question, alternative))
+
+
+def current_state():
+    return json.loads(json.dumps(teampys.get_state()))
+
+
+def restore(monkeypatch, tmp_path):
+    use_memory(monkeypatch, tmp_path)
+    EventLog(str(tmp_path)).restore(teampys.apply_snapshot, teampys.apply_event)
+    return current_state()
+
+
+def check_stats(state):
+    for private_id, rat in state['rats'].items():
+        cards = [teampys.find_card_by_id(card_id) for card_id in rat['card_ids_by_team'].values()]
+        rebuilt = RATStats.from_cards(private_id, rat['questions'], rat['alternatives'], cards)
+        assert state['stats'][private_id] == rebuilt.to_dict()
+
+
+def test_replay_create_grab_uncover(monkeypatch, tmp_path):
+    use_memory(monkeypatch, tmp_path)
+    teampys.init_event_log()
+    client = teampys.app.test_client()
+    rat = create(client)
+    client.get('/grab/{}/1'.format(rat.public_id))
+    answer(client, rat, 1, 1, 'B')
+    answer(client, rat, 1, 1, 'B')
+    answer(client, rat, 1, 1, 'A')
+    answer(client, rat, 2, 2, 'B')
+    expected = current_state()
+    teampys.event_log.close()
+    state = restore(monkeypatch, tmp_path)
+    assert state == expected
+    assert state['rats'][rat.private_id]['grabbed_rats'] == ['1']
+    check_stats(state)
+
+
+def test_replay_after_crash_during_snapshot(monkeypatch, tmp_path):
+    # the snapshot is on disk, but the old log with the create was not removed yet,
+    # so the create is replayed on top of a snapshot that contains the answered cards
+    use_memory(monkeypatch, tmp_path)
+    teampys.init_event_log()
+    log = teampys.event_log
+    client = teampys.app.test_client()
+    rat = create(client)
+    answer(client, rat, 1, 1, 'B')
+    answer(client, rat, 2, 1, 'A')
+    with log.lock:
+        data = json.dumps(log.get_state())
+        log.file.close()
+        os.replace(log.log_path, log.old_log_path)
+        log.file = open(log.log_path, 'w')
+    log.write_snapshot(data)
+    answer(client, rat, 1, 1, 'A')
+    answer(client, rat, 3, 2, 'C')
+    expected = current_state()
+    log.close()
+    state = restore(monkeypatch, tmp_path)
+    assert state == expected
+    check_stats(state)
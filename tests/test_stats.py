@@ -0,0 +1,55 @@
+from classes import Card, RATStats
+
+
+def new_cards(teams=3):
+    return [Card.new_card(None, str(team), 3, 4, 'ABC', 'red', 'rat') for team in range(1, teams + 1)]
+
+
+def uncover_all(cards, answers):
+    # applies the answers like show_card does and returns the incrementally kept statistics
+    d = RATStats.new_stats('rat', 3, 4).to_dict()
+    for team, question, alternative in answers:
+        RATStats.increment(d, cards[team].uncover(question, alternative))
+    return RATStats.from_dict(d)
+
+
+def test_uncover_paths_wrong_then_right():
+    card = new_cards(1)[0]
+    assert card.uncover(1, 'B') == ['questions.1.started', 'questions.1.first_guesses.B']
+    assert card.uncover(1, 'C') == []
+    assert card.uncover(1, 'A') == ['questions.1.finished']
+
+
+def test_uncover_paths_right_first():
+    card = new_cards(1)[0]
+    assert card.uncover(2, 'B') == ['questions.2.started', 'questions.2.first_guesses.B',
+                                    'questions.2.correct_on_first_attempt', 'questions.2.finished']
+
+
+def test_repeated_uncover_changes_nothing():
+    card = new_cards(1)[0]
+    card.uncover(1, 'A')
+    assert card.uncover(1, 'A') == []
+    card.uncover(2, 'D')
+    assert card.uncover(2, 'D') == []
+
+
+def test_increments_match_rebuild():
+    cards = new_cards()
+    answers = [(0, 1, 'A'), (1, 1, 'B'), (1, 1, 'B'), (1, 1, 'A'), (2, 1, 'C'),
+               (0, 2, 'C'), (0, 2, 'B'), (2, 2, 'B'), (2, 2, 'B'), (1, 3, 'D')]
+    stats = uncover_all(cards, answers)
+    assert stats.to_dict() == RATStats.from_cards('rat', 3, 4, cards).to_dict()
+    first = stats.get_summary()['questions'][0]
+    assert first['first_guesses'] == {'A': 1, 'B': 1, 'C': 1, 'D': 0}
+    assert first['started'] == 3
+    assert first['working'] == 1
+    assert first['percent_correct'] == 33
+
+
+def test_summary_of_untouched_question():
+    stats = uncover_all(new_cards(), [])
+    third = stats.get_summary()['questions'][2]
+    assert third['started'] == 0
+    assert third['working'] == 0
+    assert third['percent_correct'] is None